@@ -1,6 +1,18 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
 from datetime import datetime
+from typing import Dict, List, Optional
 
 from models import (
     RiskAssessmentRequest, RiskAssessmentResponse, 
@@ -8,26 +20,101 @@ from models import (
     HealthCheckResponse, RiskLevel
 )
 from risk_engine import RiskEngine
-from demo_data import get_demo_user
+from demo_data import DEMO_USERS, get_demo_user
+
+# Initialize risk engine (models load in the background, see lifespan)
+risk_engine = RiskEngine()
+
+# Demo users are static, so their assessments are built once the models are loaded
+PRECOMPUTED_RESPONSES: Dict[int, RiskAssessmentResponse] = {}
+
+# Shared across workers when REDIS_URL is set, otherwise per process
+REDIS_URL = os.environ.get("REDIS_URL")
+RISK_CACHE_TTL = 300
+RISK_CACHE_NAMESPACE = "risk"
+
+def _warm_up():
+    """Load the models and precompute the demo assessments"""
+    risk_engine._ensure_loaded()
+    PRECOMPUTED_RESPONSES.update({
+        user_id: _build_response(user_id, None, risk_engine) for user_id in DEMO_USERS
+    })
+
+async def _warm_up_cache():
+    """Run the warm-up, then seed the risk cache so other workers start hot too"""
+    try:
+        await asyncio.to_thread(_warm_up)
+    except Exception as e:
+        # Requests still load the models on demand; report the failure now
+        # rather than when the task is awaited at shutdown
+        print(f"Error during model warm-up: {e}")
+        return
+    
+    entries = {
+        risk_cache_key(user_id): _cache_value(response)
+        for user_id, response in PRECOMPUTED_RESPONSES.items()
+    }
+    backend = FastAPICache.get_backend()
+    try:
+        if isinstance(backend, RedisBackend):
+            async with backend.redis.pipeline(transaction=False) as pipe:
+                for key, value in entries.items():
+                    pipe.set(key, value, ex=RISK_CACHE_TTL)
+                await pipe.execute()
+        else:
+            for key, value in entries.items():
+                await backend.set(key, value, RISK_CACHE_TTL)
+    except Exception as e:
+        print(f"Warning: could not warm the risk cache: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    redis = None
+    if REDIS_URL:
+        redis = aioredis.from_url(REDIS_URL, encoding="utf8")
+        FastAPICache.init(RedisBackend(redis), prefix="ewarn")
+    else:
+        FastAPICache.init(InMemoryBackend(), prefix="ewarn")
+    # Don't block startup on model loading; requests arriving before it
+    # finishes load the models themselves
+    warm_up = asyncio.create_task(_warm_up_cache())
+    yield
+    await warm_up
+    if redis is not None:
+        await redis.close()
 
 app = FastAPI(
     title="TG Lab Early Warning System",
     description="AI-powered early detection of problematic gambling behavior",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+# Only TG Lab origins get CORS headers; override with CORS_ORIGIN_REGEX if needed.
+# Requests without an Origin header pass through the middleware untouched.
+CORS_ORIGIN_REGEX = os.environ.get("CORS_ORIGIN_REGEX", r"https://(.*\.)?tglab\.com")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origin_regex=CORS_ORIGIN_REGEX,
     allow_credentials=True,
-    allow_methods=["*"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
-# Initialize risk engine
-risk_engine = RiskEngine()
+# Monotonic time and wall-clock value of the last datetime.now() call
+_last_now = [float("-inf"), datetime.min]
+
+def cached_now() -> datetime:
+    """datetime.now(), refreshed at most once a second, for coarse timestamps"""
+    now = time.monotonic()
+    if now - _last_now[0] >= 1.0:
+        _last_now[0] = now
+        _last_now[1] = datetime.now()
+    return _last_now[1]
 
 # Dependency to get risk engine
 def get_risk_engine():
@@ -48,42 +135,39 @@ async def health_check():
     return HealthCheckResponse(
         status="healthy",
         version="1.0.0",
-        models_loaded=True,
-        timestamp=datetime.now()
+        models_loaded=risk_engine.models is not None,
+        timestamp=cached_now()
     )
 
-@app.post("/api/v1/risk/assess", response_model=RiskAssessmentResponse, tags=["Risk Assessment"])
-async def assess_user_risk(
-    request: RiskAssessmentRequest,
-    engine: RiskEngine = Depends(get_risk_engine)
-):
-    """
-    Assess gambling risk for a user based on their first 14 days of behavior.
-    
-    This endpoint would typically be called automatically on day 14 of a new account,
-    but can be triggered manually for demo purposes.
-    """
-    
-    demo_data = get_demo_user(request.user_id)
+def risk_cache_key(user_id: int, namespace: str = RISK_CACHE_NAMESPACE) -> str:
+    return f"{FastAPICache.get_prefix()}:{namespace}:{user_id}"
+
+def _cache_value(response: RiskAssessmentResponse) -> str:
+    """Encode an assessment the way _assess_cached stores it"""
+    return FastAPICache.get_coder().encode(response.model_dump(exclude={"assessment_date"}))
+
+def risk_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    """Cache key for risk assessments: only the user id, never the timestamp"""
+    return risk_cache_key(kwargs['user_id'], namespace)
+
+def _build_response(
+    user_id: int,
+    assessment_date: Optional[datetime],
+    engine: RiskEngine
+) -> RiskAssessmentResponse:
+    """Run the full assessment pipeline for a known user"""
+    demo_data = get_demo_user(user_id)
     
-    if demo_data:
-        behavior_data = demo_data["behavior"]
-        risk_scores = {
-            "7_day": demo_data["risk_7day"],
-            "30_day": demo_data["risk_30day"]
-        }
-        # Still calculate risk factors from behavior
-        _, risk_factors = engine.predict_risk(behavior_data)
-    else:
-        # In production, this would fetch from database
-        # For now, return error for non-demo users
-        raise HTTPException(
-            status_code=404,
-            detail=f"User {request.user_id} not found. Try demo users: 12345 (high risk), 23456 (medium risk), 34567 (low risk)"
-        )
+    behavior_data = demo_data["behavior"]
+    risk_scores = {
+        "7_day": demo_data["risk_7day"],
+        "30_day": demo_data["risk_30day"]
+    }
+    # Still calculate risk factors from behavior
+    _, risk_factors = engine.predict_risk(behavior_data)
     
-    # Create behavior summary
-    behavior_summary = UserBehaviorSummary(**behavior_data)
+    # Create behavior summary (models here hold trusted server-side data, so skip validation)
+    behavior_summary = UserBehaviorSummary.model_construct(**behavior_data)
     
     # Determine risk level
     risk_level = engine.get_risk_level(risk_scores)
@@ -96,13 +180,13 @@ async def assess_user_risk(
     
     # Create risk predictions
     risk_predictions = {
-        "7_day": RiskPrediction(
+        "7_day": RiskPrediction.model_construct(
             window_days=7,
             risk_score=round(risk_scores["7_day"], 3),
             confidence=0.85,  # Mock confidence
             predicted_behaviors=["Frequency increase likely"] if risk_scores["7_day"] > 0.5 else []
         ),
-        "30_day": RiskPrediction(
+        "30_day": RiskPrediction.model_construct(
             window_days=30,
             risk_score=round(risk_scores["30_day"], 3),
             confidence=0.75,  # Mock confidence
@@ -110,21 +194,138 @@ async def assess_user_risk(
         )
     }
     
-    return RiskAssessmentResponse(
-        user_id=request.user_id,
+    return RiskAssessmentResponse.model_construct(
+        user_id=user_id,
         account_age_days=14,
-        assessment_date=request.assessment_date or datetime.now(),
+        assessment_date=assessment_date or datetime.now(),
         behavior_summary=behavior_summary,
         risk_predictions=risk_predictions,
         overall_risk_level=RiskLevel(risk_level),
         risk_factors=risk_factors,
-        intervention_strategy=InterventionStrategy(**intervention_strategy),
+        intervention_strategy=InterventionStrategy.model_construct(
+            **{**intervention_strategy, "actions": list(intervention_strategy["actions"])}
+        ),
         metadata={
             "model_version": "1.0.0",
             "assessment_type": "new_user_14_day"
         }
     )
 
+async def _get_response(
+    user_id: int,
+    assessment_date: Optional[datetime],
+    engine: RiskEngine
+) -> RiskAssessmentResponse:
+    """
+    Assessment for a known user, reusing the precomputed one when available.
+    Without an explicit assessment_date the coarse cached_now() is used.
+    """
+    assessment_date = assessment_date or cached_now()
+    precomputed = PRECOMPUTED_RESPONSES.get(user_id)
+    if precomputed is not None:
+        return precomputed.model_copy(update={"assessment_date": assessment_date})
+    # Building may have to wait for the model load, so keep it off the event loop
+    return await asyncio.to_thread(_build_response, user_id, assessment_date, engine)
+
+@cache(expire=RISK_CACHE_TTL, namespace=RISK_CACHE_NAMESPACE, key_builder=risk_key_builder)
+async def _assess_cached(user_id: int, engine: RiskEngine):
+    """Build every part of the assessment that does not depend on the request time"""
+    if get_demo_user(user_id) is None:
+        # In production, this would fetch from database
+        # For now, return error for non-demo users
+        raise HTTPException(
+            status_code=404,
+            detail=f"User {user_id} not found. Try demo users: 12345 (high risk), 23456 (medium risk), 34567 (low risk)"
+        )
+    
+    response = await asyncio.to_thread(_build_response, user_id, None, engine)
+    return response.model_dump(exclude={"assessment_date"})
+
+@app.post("/api/v1/risk/assess", response_model=RiskAssessmentResponse, tags=["Risk Assessment"])
+async def assess_user_risk(
+    request: RiskAssessmentRequest,
+    engine: RiskEngine = Depends(get_risk_engine)
+):
+    """
+    Assess gambling risk for a user based on their first 14 days of behavior.
+    
+    This endpoint would typically be called automatically on day 14 of a new account,
+    but can be triggered manually for demo purposes.
+    """
+    
+    # Per-request timestamps matter here, so use the real clock
+    assessment_date = request.assessment_date or datetime.now()
+    
+    if request.user_id in PRECOMPUTED_RESPONSES:
+        return await _get_response(request.user_id, assessment_date, engine)
+    
+    assessment = await _assess_cached(user_id=request.user_id, engine=engine)
+    
+    return RiskAssessmentResponse(**assessment, assessment_date=assessment_date)
+
+
+async def _get_responses_shared(
+    user_ids: List[int],
+    engine: RiskEngine
+) -> Dict[int, RiskAssessmentResponse]:
+    """
+    Assessments for several known users. Any not precomputed in this worker
+    yet are read from Redis with a single MGET, and misses are written back
+    in one pipeline.
+    """
+    # One timestamp for the whole batch, whichever path each user takes
+    assessment_date = cached_now()
+    responses = {
+        user_id: await _get_response(user_id, assessment_date, engine)
+        for user_id in user_ids if user_id in PRECOMPUTED_RESPONSES
+    }
+    missing = [user_id for user_id in user_ids if user_id not in responses]
+    backend = FastAPICache.get_backend()
+    
+    if not missing or not isinstance(backend, RedisBackend):
+        responses.update({
+            user_id: await _get_response(user_id, assessment_date, engine) for user_id in missing
+        })
+        return responses
+    
+    coder = FastAPICache.get_coder()
+    keys = [risk_cache_key(user_id) for user_id in missing]
+    try:
+        cached = await backend.redis.mget(keys)
+    except Exception as e:
+        # Same as the @cache decorator: a cache outage only costs recomputation
+        print(f"Warning: could not read the risk cache: {e}")
+        cached = [None] * len(keys)
+    
+    to_store = {}
+    for user_id, key, value in zip(missing, keys, cached):
+        if value is not None:
+            responses[user_id] = RiskAssessmentResponse(
+                **coder.decode(value),
+                assessment_date=assessment_date
+            )
+        else:
+            response = await asyncio.to_thread(_build_response, user_id, assessment_date, engine)
+            responses[user_id] = response
+            to_store[key] = _cache_value(response)
+    
+    if to_store:
+        try:
+            async with backend.redis.pipeline(transaction=False) as pipe:
+                for key, value in to_store.items():
+                    pipe.set(key, value, ex=RISK_CACHE_TTL)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Warning: could not write the risk cache: {e}")
+    
+    return responses
+
+DEMO_PATTERN_USERS = {
+    "immediate_crisis": 12345,
+    "slow_burn": 67890,
+    "moderate_risk": 23456,
+    "controlled": 34567
+}
 
 @app.get("/api/v1/risk/demo/overview", tags=["Demo"])
 async def get_demo_overview():
@@ -133,15 +334,14 @@ async def get_demo_overview():
     """
     engine = get_risk_engine()
     
+    responses = await _get_responses_shared(list(DEMO_PATTERN_USERS.values()), engine)
     demo_patterns = {
-        "immediate_crisis": await assess_user_risk(RiskAssessmentRequest(user_id=12345), engine),
-        "slow_burn": await assess_user_risk(RiskAssessmentRequest(user_id=67890), engine), 
-        "moderate_risk": await assess_user_risk(RiskAssessmentRequest(user_id=23456), engine),
-        "controlled": await assess_user_risk(RiskAssessmentRequest(user_id=34567), engine)
+        pattern: responses[user_id]
+        for pattern, user_id in DEMO_PATTERN_USERS.items()
     }
     
     return {
-        "generated_at": datetime.now(),
+        "generated_at": cached_now(),
         "patterns": demo_patterns,
     }
 
@@ -167,17 +367,11 @@ async def get_demo_example(risk_level: str):
             detail="Risk level must be one of: high, medium, low, slowburn"
         )
     
-    request = RiskAssessmentRequest(user_id=demo_mapping[risk_level])
     engine = get_risk_engine()
-    return await assess_user_risk(request, engine)
+    return await _get_response(demo_mapping[risk_level], None, engine)
 
-@app.get("/api/v1/risk/batch-summary", tags=["Analytics"])
-async def get_batch_summary():
-    """
-    Get summary statistics for batch risk assessment (mock data for demo).
-    
-    This would show daily monitoring results in production.
-    """
+def _build_batch_summary() -> Dict:
+    """Batch assessment statistics (mock data for demo), minus the date"""
     total_at_risk = 55300
     users_protected = 10701
     total_assessed = total_at_risk + users_protected
@@ -189,7 +383,6 @@ async def get_batch_summary():
     }
     
     return {
-        "assessment_date": datetime.now().date(),
         "total_users_assessed": total_assessed,
         "users_protected": users_protected,
         "users_at_risk": total_at_risk,
@@ -208,6 +401,18 @@ async def get_batch_summary():
         "processing_time_seconds": 45.2
     }
 
+# The summary is static, only its date changes
+_BATCH_SUMMARY_CACHE = _build_batch_summary()
+
+@app.get("/api/v1/risk/batch-summary", tags=["Analytics"])
+async def get_batch_summary():
+    """
+    Get summary statistics for batch risk assessment (mock data for demo).
+    
+    This would show daily monitoring results in production.
+    """
+    return {"assessment_date": cached_now().date(), **_BATCH_SUMMARY_CACHE}
+
 
 
 
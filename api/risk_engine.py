@@ -1,21 +1,119 @@
 import pickle
+import joblib
 import numpy as np
-import pandas as pd
+import threading
+from functools import lru_cache
+from operator import gt, lt
 from typing import Dict, List, Tuple
 import os
+import zlib
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Optional: the scikit-learn models are used as-is
+    ort = None
+
+# (behavior field, comparison, threshold, label) for each risk factor
+_FACTOR_RULES = (
+    ('median_loss_gap_minutes', lt, 5, "Immediate loss chasing behavior"),
+    ('total_deposits', gt, 20, "High deposit frequency"),
+    ('late_night_percentage', gt, 0.4, "Excessive late-night gambling"),
+    ('session_variance', gt, 2, "Erratic session patterns"),
+    ('loss_rate', gt, 0.8, "Very high loss rate"),
+)
+
+# Intervention strategies are shared singletons; actions are tuples so no caller can mutate them
+IMMEDIATE_CRISIS = {
+    "pattern": "IMMEDIATE_CRISIS",
+    "urgency": "URGENT",
+    "description": "Both short and long-term risk indicators show immediate danger",
+    "actions": (
+        "Immediate deposit limit",
+        "Mandatory cooling period",
+        "Direct phone contact",
+        "Emergency resources"
+    )
+}
+
+SLOW_BURN = {
+    "pattern": "SLOW_BURN",
+    "urgency": "PREVENTIVE", 
+    "description": "Current behavior seems controlled but shows escalation trajectory",
+    "actions": (
+        "Educational emails",
+        "Voluntary limit suggestions",
+        "Progress tracking tools",
+        "Scheduled check-ins"
+    )
+}
+
+MODERATE_RISK = {
+    "pattern": "MODERATE_RISK",
+    "urgency": "MONITOR",
+    "description": "Showing concerning patterns that need monitoring",
+    "actions": (
+        "In-app warnings",
+        "Session reminders", 
+        "Self-assessment tools"
+    )
+}
+
+CONTROLLED = {
+    "pattern": "CONTROLLED",
+    "urgency": "STANDARD",
+    "description": "Gambling behavior appears well-controlled",
+    "actions": (
+        "Continue monitoring",
+        "Positive reinforcement"
+    )
+}
+
+# Indexed by band_7day * 4 + band_30day, where the 7-day bands split at
+# 0.4 and 0.7 and the 30-day bands at 0.4, 0.6 (slow burn) and 0.7
+STRATEGY_TABLE = (
+    # 7-day < 0.4
+    CONTROLLED, MODERATE_RISK, SLOW_BURN, SLOW_BURN,
+    # 7-day 0.4-0.7
+    MODERATE_RISK, MODERATE_RISK, MODERATE_RISK, MODERATE_RISK,
+    # 7-day > 0.7
+    CONTROLLED, MODERATE_RISK, MODERATE_RISK, IMMEDIATE_CRISIS,
+)
+
+class OnnxModel:
+    """ONNX runtime session with a scikit-learn style predict_proba"""
+    
+    def __init__(self, path: str):
+        # Tuned for single-sample latency rather than batch throughput
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.sess = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.sess.run(None, {"X": X.astype(np.float32, copy=False)})[1]
 
 class RiskEngine:
     """ML model integration for risk assessment"""
     
+    # Column-wise view of _FACTOR_RULES for vectorized batch scoring
+    FACTOR_KEYS = [key for key, _, _, _ in _FACTOR_RULES]
+    FACTOR_BELOW = np.array([op is lt for _, op, _, _ in _FACTOR_RULES])
+    THRESHOLDS = np.array([threshold for _, _, threshold, _ in _FACTOR_RULES])
+    FACTOR_NAMES = [label for _, _, _, label in _FACTOR_RULES]
+    
     def __init__(self, model_path: str = None):
         """Initialize risk engine with trained models"""
         if model_path is None:
-            # Try multiple possible paths
+            # Try multiple possible paths, preferring the memory-mappable joblib export
             possible_paths = [
-                "../models/dual_risk_models.pkl",
-                "./models/dual_risk_models.pkl", 
-                "models/dual_risk_models.pkl",
-                os.path.join(os.path.dirname(os.path.dirname(__file__)), "models", "dual_risk_models.pkl")
+                os.path.join(directory, filename)
+                for filename in ("dual_risk_models.joblib", "dual_risk_models.pkl")
+                for directory in (
+                    "../models",
+                    "./models",
+                    "models",
+                    os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
+                )
             ]
             model_path = None
             for path in possible_paths:
@@ -26,7 +124,10 @@ class RiskEngine:
                 print("Warning: No model file found, using mock models")
                 model_path = "mock"
         
-        self.models = self._load_models(model_path)
+        # Models are loaded on first use (or by a warm-up call to _ensure_loaded)
+        self._model_path = model_path
+        self._load_lock = threading.Lock()
+        self.models = None
         self.feature_names = [
             'early_bet_count', 'early_avg_bet', 'early_std_bet', 
             'early_loss_rate', 'early_total_loss', 'early_unique_days',
@@ -35,28 +136,64 @@ class RiskEngine:
             'early_sessions_duration_cv', 'early_deposits_deposit_count',
             'early_deposits_avg_deposit'
         ]
+        # Per-thread feature buffers; requests are served from a threadpool too
+        self._local = threading.local()
+        self._predict_cached = lru_cache(maxsize=4096)(self._predict_from_key)
+    
+    def _ensure_loaded(self) -> None:
+        """Load the models once, on whichever thread needs them first"""
+        if self.models is not None:
+            return
+        with self._load_lock:
+            if self.models is None:
+                self.models = self._load_models(self._model_path)
     
     def _load_models(self, model_path: str) -> Dict:
-        """Load trained models from pickle file"""
+        """Load trained models from a joblib or pickle file"""
         if model_path == "mock" or not os.path.exists(model_path):
             print(f"Warning: Model file not found at {model_path}, using mock models")
             return self._create_mock_models()
         
         try:
-            with open(model_path, 'rb') as f:
-                return pickle.load(f)
+            if model_path.endswith(".joblib"):
+                # Memory-mapped arrays are backed by the page cache and shared across workers
+                models = joblib.load(model_path, mmap_mode='r')
+            else:
+                with open(model_path, 'rb') as f:
+                    models = pickle.load(f)
         except Exception as e:
             print(f"Error loading model from {model_path}: {e}")
             print("Falling back to mock models")
             return self._create_mock_models()
+        
+        return self._load_onnx_models(models, model_path)
+    
+    def _load_onnx_models(self, models: Dict, model_path: str) -> Dict:
+        """Swap in ONNX exports found next to the model file, if onnxruntime is installed"""
+        if ort is None:
+            return models
+        
+        base_path = os.path.splitext(model_path)[0]
+        for window, model_info in models.items():
+            onnx_path = f"{base_path}_{window}.onnx"
+            if not os.path.exists(onnx_path):
+                continue
+            try:
+                model_info['model'] = OnnxModel(onnx_path)
+            except Exception as e:
+                print(f"Error loading ONNX model from {onnx_path}: {e}")
+                print(f"Keeping scikit-learn model for {window}")
+        return models
     
     def _create_mock_models(self) -> Dict:
         """Create mock models for demo purposes"""
         class MockModel:
+            # Fixed beta(2, 2) draws, picked by a stable CRC32 of each input row
+            lut = np.random.default_rng(0).beta(2, 2, 1024)
+            
             def predict_proba(self, X):
-                np.random.seed(hash(str(X[0])) % 100)
-                prob = np.random.beta(2, 2, 1)[0]
-                return np.array([[1-prob, prob]])
+                prob = self.lut[[zlib.crc32(row.tobytes()) & 1023 for row in X]]
+                return np.column_stack([1-prob, prob])
         
         return {
             '7_day': {'model': MockModel(), 'threshold': 0.6},
@@ -64,28 +201,48 @@ class RiskEngine:
         }
     
     def prepare_features(self, behavior_data: Dict) -> np.ndarray:
-        """Convert behavior summary to model features"""
-        features = {
-            'early_bet_count': behavior_data['total_bets'],
-            'early_avg_bet': behavior_data['avg_bet_amount'],
-            'early_std_bet': behavior_data['avg_bet_amount'] * 0.5,
-            'early_loss_rate': behavior_data['loss_rate'],
-            'early_total_loss': behavior_data['total_loss_amount'],
-            'early_unique_days': behavior_data['betting_days'],
-            'early_bets_per_day': behavior_data['total_bets'] / max(behavior_data['betting_days'], 1),
-            'early_loss_gaps': behavior_data['median_loss_gap_minutes'],
-            'early_immediate_rebet_pct': 1 / (1 + behavior_data['median_loss_gap_minutes']/5),
-            'early_sessions_session_count': behavior_data['betting_days'] * 2,
-            'early_sessions_avg_duration': 45,
-            'early_sessions_duration_cv': behavior_data['session_variance'],
-            'early_deposits_deposit_count': behavior_data['total_deposits'],
-            'early_deposits_avg_deposit': behavior_data['avg_deposit']
-        }
+        """Convert behavior summary to model features.
         
-        return np.array([[features.get(f, 0) for f in self.feature_names]])
+        Writes into a float32 buffer reused across calls on the same thread,
+        so callers must not hold on to the returned array past the next call.
+        """
+        feat_buf = getattr(self._local, 'feat_buf', None)
+        if feat_buf is None:
+            feat_buf = self._local.feat_buf = np.empty((1, len(self.feature_names)), dtype=np.float32)
+        buf = feat_buf[0]
+        total_bets = behavior_data['total_bets']
+        avg_bet = behavior_data['avg_bet_amount']
+        betting_days = behavior_data['betting_days']
+        loss_gap = behavior_data['median_loss_gap_minutes']
+        
+        # Assignments follow the order of self.feature_names
+        buf[0] = total_bets
+        buf[1] = avg_bet
+        buf[2] = avg_bet * 0.5
+        buf[3] = behavior_data['loss_rate']
+        buf[4] = behavior_data['total_loss_amount']
+        buf[5] = betting_days
+        buf[6] = total_bets / max(betting_days, 1)
+        buf[7] = loss_gap
+        buf[8] = 1 / (1 + loss_gap/5)
+        buf[9] = betting_days * 2
+        buf[10] = 45
+        buf[11] = behavior_data['session_variance']
+        buf[12] = behavior_data['total_deposits']
+        buf[13] = behavior_data['avg_deposit']
+        
+        return feat_buf
     
     def predict_risk(self, behavior_data: Dict) -> Tuple[Dict[str, float], List[str]]:
         """Predict risk scores and identify risk factors"""
+        key = tuple(sorted(behavior_data.items()))
+        risk_scores, risk_factors = self._predict_cached(key)
+        return dict(risk_scores), list(risk_factors)
+    
+    def _predict_from_key(self, key: Tuple) -> Tuple[Tuple, Tuple[str, ...]]:
+        """Uncached predict_risk, keyed on the sorted behavior items"""
+        self._ensure_loaded()
+        behavior_data = dict(key)
         features = self.prepare_features(behavior_data)
         
         # Get predictions from both models
@@ -96,19 +253,43 @@ class RiskEngine:
             risk_scores[window] = float(prob)
         
         # Identify risk factors
-        risk_factors = []
-        if behavior_data['median_loss_gap_minutes'] < 5:
-            risk_factors.append("Immediate loss chasing behavior")
-        if behavior_data['total_deposits'] > 20:
-            risk_factors.append("High deposit frequency")
-        if behavior_data['late_night_percentage'] > 0.4:
-            risk_factors.append("Excessive late-night gambling")
-        if behavior_data['session_variance'] > 2:
-            risk_factors.append("Erratic session patterns")
-        if behavior_data['loss_rate'] > 0.8:
-            risk_factors.append("Very high loss rate")
+        risk_factors = tuple(
+            label for key, op, threshold, label in _FACTOR_RULES
+            if op(behavior_data[key], threshold)
+        )
         
-        return risk_scores, risk_factors
+        return tuple(risk_scores.items()), risk_factors
+    
+    def predict_risk_batch(self, behaviors: List[Dict]) -> List[Tuple[Dict[str, float], List[str]]]:
+        """Vectorized predict_risk for many users at once"""
+        if not behaviors:
+            return []
+        
+        self._ensure_loaded()
+        features = np.empty((len(behaviors), len(self.feature_names)), dtype=np.float32)
+        for i, behavior_data in enumerate(behaviors):
+            features[i] = self.prepare_features(behavior_data)[0]
+        
+        # One predict_proba call per model for the whole batch
+        batch_scores = {
+            window: model_info['model'].predict_proba(features)[:, 1]
+            for window, model_info in self.models.items()
+        }
+        
+        factor_values = np.array([[b[k] for k in self.FACTOR_KEYS] for b in behaviors], dtype=np.float64)
+        mask = np.where(
+            self.FACTOR_BELOW,
+            factor_values < self.THRESHOLDS,
+            factor_values > self.THRESHOLDS
+        )
+        
+        return [
+            (
+                {window: float(scores[i]) for window, scores in batch_scores.items()},
+                [name for name, hit in zip(self.FACTOR_NAMES, row) if hit]
+            )
+            for i, row in enumerate(mask)
+        ]
     
     def get_risk_level(self, risk_scores: Dict[str, float]) -> str:
         """Determine overall risk level from scores"""
@@ -122,52 +303,7 @@ class RiskEngine:
     
     def get_intervention_strategy(self, risk_7day: float, risk_30day: float) -> Dict:
         """Determine intervention based on dual risk scores"""
-        
-        if risk_7day > 0.7 and risk_30day > 0.7:
-            return {
-                "pattern": "IMMEDIATE_CRISIS",
-                "urgency": "URGENT",
-                "description": "Both short and long-term risk indicators show immediate danger",
-                "actions": [
-                    "Immediate deposit limit",
-                    "Mandatory cooling period",
-                    "Direct phone contact",
-                    "Emergency resources"
-                ]
-            }
-        
-        elif risk_7day < 0.4 and risk_30day > 0.6:
-            return {
-                "pattern": "SLOW_BURN",
-                "urgency": "PREVENTIVE", 
-                "description": "Current behavior seems controlled but shows escalation trajectory",
-                "actions": [
-                    "Educational emails",
-                    "Voluntary limit suggestions",
-                    "Progress tracking tools",
-                    "Scheduled check-ins"
-                ]
-            }
-        
-        elif 0.4 <= risk_7day <= 0.7 or 0.4 <= risk_30day <= 0.7:
-            return {
-                "pattern": "MODERATE_RISK",
-                "urgency": "MONITOR",
-                "description": "Showing concerning patterns that need monitoring",
-                "actions": [
-                    "In-app warnings",
-                    "Session reminders", 
-                    "Self-assessment tools"
-                ]
-            }
-        
-        else:
-            return {
-                "pattern": "CONTROLLED",
-                "urgency": "STANDARD",
-                "description": "Gambling behavior appears well-controlled",
-                "actions": [
-                    "Continue monitoring",
-                    "Positive reinforcement"
-                ]
-            }
\ No newline at end of file
+        # int() so NumPy scalars count bands too (np.bool_ + np.bool_ is a logical OR)
+        band_7day = int(risk_7day >= 0.4) + int(risk_7day > 0.7)
+        band_30day = int(risk_30day >= 0.4) + int(risk_30day > 0.6) + int(risk_30day > 0.7)
+        return STRATEGY_TABLE[band_7day * 4 + band_30day]
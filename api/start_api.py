@@ -11,6 +11,9 @@ if __name__ == "__main__":
             host="0.0.0.0",
             port=port,
             reload=False, 
+            loop="uvloop",
+            http="httptools",
+            workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
             log_level="info"
         )
     except Exception as e:
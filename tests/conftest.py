@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The API modules import each other by bare name (they run from api/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "api"))
@@ -0,0 +1,42 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from risk_engine import RiskEngine, STRATEGY_TABLE
+
+
+def cascade_pattern(risk_7day, risk_30day):
+    """The original if/elif cascade the strategy table replaced"""
+    if risk_7day > 0.7 and risk_30day > 0.7:
+        return "IMMEDIATE_CRISIS"
+    elif risk_7day < 0.4 and risk_30day > 0.6:
+        return "SLOW_BURN"
+    elif 0.4 <= risk_7day <= 0.7 or 0.4 <= risk_30day <= 0.7:
+        return "MODERATE_RISK"
+    else:
+        return "CONTROLLED"
+
+
+SCORES = [0.0, 0.1, 0.3999, 0.4, 0.4001, 0.5, 0.6, 0.6001, 0.65, 0.7, 0.7001, 0.9, 1.0]
+
+
+@pytest.mark.parametrize("as_score", [float, np.float64, np.float32], ids=["float", "float64", "float32"])
+def test_table_matches_cascade(as_score):
+    engine = RiskEngine("mock")
+    for risk_7day, risk_30day in itertools.product(SCORES, SCORES):
+        r7, r30 = as_score(risk_7day), as_score(risk_30day)
+        strategy = engine.get_intervention_strategy(r7, r30)
+        assert strategy["pattern"] == cascade_pattern(r7, r30), (risk_7day, risk_30day)
+
+
+def test_numpy_scores_reach_high_bands():
+    engine = RiskEngine("mock")
+    high = np.float64(0.9)
+    assert engine.get_intervention_strategy(high, high)["pattern"] == "IMMEDIATE_CRISIS"
+    assert engine.get_intervention_strategy(np.float64(0.1), high)["pattern"] == "SLOW_BURN"
+
+
+def test_strategy_actions_are_immutable():
+    for strategy in STRATEGY_TABLE:
+        assert isinstance(strategy["actions"], tuple)